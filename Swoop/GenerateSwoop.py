@@ -98,6 +98,8 @@ class Attr:
                  xmlName=None,
                  lookupEFP=None,
                  isKey=False,
+                 intern=None,
+                 isRefKey=False,
                  **quirks):
         """Create a class describing an attribute.
         
@@ -107,11 +109,14 @@ class Attr:
         :param unparse: String used to unparse the attribute value while generating XML. It will be invoked as :code:`unparse(x)` where :code:`x` is :mod:`Swoop`'s value for the attribute.  :code:'unparse(parse(x))` should be the identity function.
         :param accessorName:This is the string that will appear in Swoop API calls.  For example :code:`foo.get_class()`
         :param xmlName:This is string used in the XML representation.  For example, :code:`class`.
-        :param lookupEFP: This is a tuple.  The first element is a type.  The second is a function that looks up an object of that type based on the value of this attribute.  Function should take two arguments, the current :class:`EagleFilePart` and the value of the attribute. 
+        :param lookupEFP: This is a tuple.  The first element is a type.  The second is a function that looks up an object of that type based on the value of this attribute.  Function should take two arguments, the current :class:`EagleFilePart` and the value of the attribute.  The optional third element lists other types the function can return. 
         :param isKey: True if this attribute is key in a map of the parent. 
+        :param isRefKey: True if other parts refer to this one by the value of this attribute rather than by its key in its parent's map.
+        :param intern: True if the attribute takes a small set of values that repeat throughout a file (e.g., rotations, fonts, or names of other parts of the design).  The loader will share a single copy of each value.  Defaults to True for attributes with a :code:`lookupEFP` and False otherwise.
         """
         self.name = name.replace("-", "_")
         self.isKey= isKey
+        self.isRefKey = isRefKey
         if xmlName is None:
             self.xmlName = name
         else:
@@ -144,6 +149,11 @@ class Attr:
         else:
             self.lookupEFP = lookupEFP
 
+        if intern is None:
+            self.intern = self.lookupEFP is not None
+        else:
+            self.intern = intern
+
         if vtype is None:
             self.vtype = "str"
         else:
@@ -168,9 +178,123 @@ class Attr:
             self.parse = parse
 
         self.quirks = quirks
+        assert not self.intern or self.vtype in ["str", "None_is_default_string"], "Only string attributes can be interned"
         
     def get_literal_default(self):
         return repr(self.default)
+
+    def has_lookup(self):
+        """
+        Return True if this attribute refers to another part and
+        :code:`find_*()` can look it up.
+        """
+        return self.lookupEFP is not None and "NotImplemented" not in self.lookupEFP[1]
+
+    def get_lookup_tags(self):
+        """
+        Return the tags of the parts this attribute can refer to.
+        """
+        types = [self.lookupEFP[0]] + (list(self.lookupEFP[2]) if len(self.lookupEFP) > 2 else [])
+        return [t.tag for t in tags.values() if t.classname in types]
+
+    ### The functions below generate type-specific code for converting
+    ### attribute values.  They must agree with :code:`parseByType()`,
+    ### :code:`unparseByType()`, and :code:`typeCheck()` in
+    ### Swoop.py.jinja, which remain the reference implementations.
+    
+    def get_parse_code(self, s):
+        """Return an expression that converts the string :code:`s` (which may be
+        :code:`None`) into this attribute's value.  Bad values raise
+        :code:`ValueError` or :code:`KeyError`.  :code:`s` must be a variable name, since it may
+        appear more than once.  The expression can refer to :code:`parent` and
+        :code:`ctx`, the arguments of :code:`_init_from_et()`.
+
+        """
+        d = self.get_literal_default()
+        if self.vtype == "None_is_default_string":
+            if self.intern:
+                return "{d} if {s} is None else ctx.strings.setdefault({s}, {s})".format(d=d, s=s)
+            return "{d} if {s} is None else {s}".format(d=d, s=s)
+        elif self.vtype == "None_is_default_float":
+            return "{d} if {s} is None else float({s})".format(d=d, s=s)
+        elif self.vtype == "None_is_default_int":
+            assert isinstance(self.default, int)
+            return "{d} if {s} is None else int({s})".format(d=d, s=s)
+        elif self.vtype == "locked_bool":
+            return "{s} == \"yes\"".format(s=s)
+        elif self.vtype == "display_bool":
+            return "{s} != \"off\"".format(s=s)
+        elif self.vtype == "constant_bool":
+            return "{s} != \"no\"".format(s=s)
+        elif self.vtype == "str":
+            if self.intern:
+                return "None if {s} is None else ctx.strings.setdefault({s}, {s})".format(s=s)
+            return s
+        elif self.vtype == "int":
+            return "None if {s} is None else int({s})".format(s=s)
+        elif self.vtype == "float":
+            return "None if {s} is None else float({s})".format(s=s)
+        elif self.vtype == "bool":
+            return "None if {s} is None else _parse_eagle_bool(parent, {s})".format(s=s)
+        elif self.vtype == "layer_string":
+            return "None if {s} is None else ctx.file.layers[int({s})].name".format(s=s)
+        else:
+            raise Exception("Unknown attr type '" + self.vtype + "'")
+
+    def get_unparse_code(self, v):
+        """Return an expression that converts the value :code:`v` of this
+        attribute into a string for the XML output or :code:`None` if the
+        attribute should be left out.  :code:`v` must be a variable name,
+        since it may appear more than once.  The expression can refer to
+        :code:`self` and :code:`ctx`, the arguments of :code:`_get_et()`.
+
+        """
+        d = self.get_literal_default()
+        if self.vtype == "None_is_default_string":
+            assert self.default is not None
+            return "None if {v} == {d} else {v}".format(d=d, v=v)
+        elif self.vtype == "None_is_default_float":
+            assert self.default is not None
+            return "None if {v} is None or {v} == {d} else num_to_str({v})".format(d=d, v=v)
+        elif self.vtype == "None_is_default_int":
+            assert self.default is not None
+            return "None if {v} is None or {v} == {d} else str({v})".format(d=d, v=v)
+        elif self.vtype == "display_bool":
+            return "None if {v} is None or {v} == True else \"off\"".format(v=v)
+        elif self.vtype == "locked_bool":
+            return "None if {v} is None or {v} == False else \"yes\"".format(v=v)
+        elif self.vtype == "constant_bool":
+            return "\"no\" if {v} is not None and not {v} else None".format(v=v)
+        elif self.vtype == "str":
+            return v
+        elif self.vtype in ["int", "float"]:
+            return "None if {v} is None else num_to_str({v})".format(v=v)
+        elif self.vtype == "bool":
+            return "None if {v} is None else (\"yes\" if {v} else \"no\")".format(v=v)
+        elif self.vtype == "layer_string":
+            return "None if {v} is None else (ctx.layer_numbers[{v}] if {v} in ctx.layer_numbers else str(ctx.file.layer_name_to_number({v})))".format(v=v)
+        else:
+            raise Exception("Unknown attr type '" + self.vtype + "'")
+
+    def get_type_check_code(self, v):
+        """Return an expression that is :code:`True` if :code:`v` is a legal value
+        for this attribute.
+
+        """
+        if self.vtype in ["None_is_default_float", "float"]:
+            t = "(float, int)"
+        elif self.vtype in ["None_is_default_int", "int"]:
+            t = "int"
+        elif self.vtype in ["locked_bool", "display_bool", "bool", "constant_bool"]:
+            t = "bool"
+        elif self.vtype in ["None_is_default_string", "str", "layer_string"]:
+            t = "str"
+        else:
+            raise Exception("Unknown attr type '" + self.vtype + "'")
+        if self.required:
+            return "isinstance({v}, {t})".format(v=v, t=t)
+        else:
+            return "{v} is None or isinstance({v}, {t})".format(v=v, t=t)
     
 def initialCap(a):
         t = a[0].upper() + a[1:]
@@ -224,6 +348,38 @@ class Collection:
 
     def get_contained_type_list(self):
         return map(initialCap,self.containedTypes)
+
+    def get_contained_tags(self):
+        """
+        Return the tags of the elements this collection holds.
+        """
+        types = map(initialCap, self.containedTypes)
+        return [t.tag for t in tags.values() if t.classname in types]
+
+    def get_container_tags(self):
+        """
+        Return a tuple literal with the tags of the elements that
+        :code:`smartAddSubTags()` creates to hold this collection's elements.
+        """
+        return "(" + "".join(['"{}", '.format(t) for t in self.get_paths()[0][:-1]]) + ")"
+
+    def get_paths(self):
+        """
+        Split :code:`xpath` into the paths it matches.  Each path is a list of
+        tag names starting just below the :class:`EagleFilePart`.  For example,
+        :code:`./plain/wire|./plain/text` yields :code:`[["plain", "wire"], ["plain", "text"]]`.
+
+        Only the simple xpaths that Swoop uses (child steps separated by '/')
+        are supported.
+        """
+        r = []
+        for p in self.xpath.split("|"):
+            p = p.strip()
+            if p[0:2] == "./":
+                p = p[2:]
+            assert re.match(r"^[\w\-]+(/[\w\-]+)*$", p), "Unsupported xpath for {}: '{}'".format(self.name, self.xpath)
+            r.append(p.split("/"))
+        return r
     
 class Map(Collection):
     """
@@ -353,6 +509,11 @@ class TagClass:
 
         self.hasCollections = (len(self.maps) + len(self.lists) + len(self.singletons) > 0)
 
+        # Collections that we can leave unloaded until they are accessed.
+        # Collections without accessors (e.g., layers) are managed by hand
+        # elsewhere and are always loaded immediately.
+        self.lazySections = [s for s in self.maps + self.lists + self.singletons if not s.suppressAccessors]
+
     def get_all_base_classes_as_str(self):
         return ", ".join([self.baseclass] + self.mixins)
     def get_all_base_classes_as_list(self):
@@ -369,6 +530,72 @@ class TagClass:
 
     def has_maps(self):
         return len(self.maps) > 0
+
+    def get_slot_names(self):
+        """
+        Return the names of the members that instances of this class hold,
+        for :code:`__slots__`.
+        """
+        r = []
+        for n in [a.name for a in self.attrs] + [s.name for s in self.sections] + ([self.preserveTextAs] if self.preserveTextAs != "" else []):
+            if n not in r:
+                r.append(n)
+        return r
+
+    def get_child_getters(self):
+        """
+        Build the table that maps the tag of each kind of child to the names
+        of the getters that return it (e.g., :code:`get_pinrefs()`).
+        :class:`From` uses it to check where the parts it finds in an index
+        are.
+
+        :returns: The table as a python literal.
+        """
+        getters = {}
+        for s in self.maps + self.lists:
+            for t in s.get_contained_tags():
+                getters.setdefault(t, []).append("get_" + s.name)
+        for s in self.singletons:
+            for t in s.get_contained_tags():
+                getters.setdefault(t, []).append("get_" + s.accessorName)
+        return "{" + ", ".join(['"{}": ({})'.format(t, "".join(['"{}", '.format(g) for g in getters[t]])) for t in sorted(getters)]) + "}"
+
+    def get_child_routes(self):
+        """Build the routing table used to sort the child elements of a tag into
+        collections.  The table is a nested dict keyed by tag name.  Each value
+        is a tuple of the name of the collection that elements with that tag
+        belong to (or :code:`None`) and the table to use for their children
+        (or :code:`None`).
+
+        This lets :code:`_init_from_et()` populate all the collections in a
+        single pass over the element tree rather than evaluating one xpath per
+        collection.
+
+        :returns: The table as a python literal.
+        """
+        routes = {}
+        for s in self.maps + self.lists + self.singletons:
+            for path in s.get_paths():
+                table = routes
+                for t in path[:-1]:
+                    section, sub = table.get(t, (None, None))
+                    if sub is None:
+                        sub = {}
+                        table[t] = (section, sub)
+                    table = sub
+                section, sub = table.get(path[-1], (None, None))
+                assert section is None, "Xpaths for {} and {} in <{}> overlap".format(section, s.name, self.tag)
+                table[path[-1]] = (s.name, sub)
+
+        def render(table):
+            r = []
+            for t in sorted(table):
+                section, sub = table[t]
+                r.append('"{}": ({}, {})'.format(t,
+                                                 "None" if section is None else '"{}"'.format(section),
+                                                 "None" if sub is None else render(sub)))
+            return "{" + ", ".join(r) + "}"
+        return render(routes)
 tags = {}
 
 def layerAttr(required=True):
@@ -410,17 +637,19 @@ def library_locally_modifiedAttr():
 def library_versionAttr():
     return Attr("library_version", required=False, vtype="int")
 def urnAttr(s="urn"):
-    return Attr(s, vtype="str", required=False)
+    return Attr(s, vtype="str", required=False, intern=True)
 
 rotAttr = Attr("rot",
                vtype="str",
-               required=False)
+               required=False,
+               intern=True)
 
-def nameAttr(isKey=True):
+def nameAttr(isKey=True, intern=False):
     return Attr("name",
                 vtype="str",
                 required=True,
-                isKey=isKey)
+                isKey=isKey,
+                intern=intern)
 
 
 smashedAttr = Attr("smashed", required=False)
@@ -485,7 +714,7 @@ tags["package3d"] = TagClass("package3d",
                            attrs=[
                                nameAttr(),
                                urnAttr(),
-                               Attr("type", vtype="str", required=True),
+                               Attr("type", intern=True, vtype="str", required=True),
                                locally_modifiedAttr(),
                                library_versionAttr(),
                                library_locally_modifiedAttr()
@@ -541,7 +770,7 @@ tags["device"] = TagClass("device",
                                  Attr("package",
                                       required=False,
                                       #vtype="None_is_default_string",
-                                      lookupEFP=("Package", "lambda efp, key: efp.get_parent().get_parent().get_package(key)"))],
+                                      lookupEFP=("Package", "lambda efp, key: _maybe(_ancestor(efp, 2), 'get_package', key)"))],
                           sections=[List("connects", "./connects/connect"),
                                     List("package3dinstances", "./package3dinstances/package3dinstance"),
                                     Map("technologies", "./technologies/technology")])
@@ -559,7 +788,8 @@ tags["net"] = TagClass("net",
                               Attr("netclass",
                                    accessorName = "class",
                                    xmlName="class",
-                                   required=False)],
+                                   required=False,
+                                   intern=True)],
                        sections = [List("segments", "./segment")])
 
 
@@ -571,7 +801,7 @@ tags["signal"] = TagClass("signal",
                                       accessorName = "class",
                                       xmlName="class",
                                       required=False,
-                                      lookupEFP=("Class", "lambda efp, key: NotImplemented('class lookup from signal not implemented')")),
+                                      lookupEFP=("Class", "lambda efp, key: _find_class(_ancestor(efp, 1), key)")),
                                  Attr("airwireshidden", 
                                          vtype="bool",
                                          required=False)],
@@ -588,7 +818,7 @@ tags["moduleinst"] = TagClass("moduleinst",
                               attrs=[nameAttr(),
                                      Attr("module",
                                           required=True,
-                                          lookupEFP=("Module","lambda efp, key: NotImplemented('Module lookup not implemented')")),
+                                          lookupEFP=("Module","lambda efp, key: _maybe(efp.get_file(), 'get_module', key)")),
                                      Attr("modulevariant", required=False),
                                      dimensionAttr("x",True),
                                      dimensionAttr("y",True),
@@ -619,9 +849,11 @@ tags["variant"] = TagClass("variant",
                                        vtype="bool",
                                        required=False),
                                   Attr("value",
-                                       required=False),
+                                       required=False,
+                                       intern=True),
                                   Attr("technology",
-                                       required=True)])
+                                       required=True,
+                                       intern=True)])
 
 
 
@@ -631,7 +863,7 @@ tags["gate"] = TagClass("gate",
                         attrs=[nameAttr(),
                                Attr("symbol",
                                     required=True,
-                                    lookupEFP=("Symbol", "lambda efp, key: efp.get_parent().get_parent().get_symbol(key)")),
+                                    lookupEFP=("Symbol", "lambda efp, key: _maybe(_ancestor(efp, 2), 'get_symbol', key)")),
                                dimensionAttr("x",True),
                                dimensionAttr("y",True),
                                Attr("addlevel", required=False),
@@ -650,13 +882,13 @@ tags["wire"] = TagClass("wire",
                                dimensionAttr("y2", required=True),
                                widthAttr(required=True),
                                layerAttr(required=True),
-                               Attr("extent", required=False),
-                               Attr("style", required=False),
+                               Attr("extent", intern=True, required=False),
+                               Attr("style", intern=True, required=False),
                                Attr("curve", 
                                     vtype="None_is_default_float",
                                     default=0.0,
                                     required=False),
-                               Attr("cap", required=False)])
+                               Attr("cap", intern=True, required=False)])
 
 
 
@@ -670,7 +902,7 @@ tags["dimension"] = TagClass("dimension",
                                     dimensionAttr("x3", required=True),
                                     dimensionAttr("y3", required=True),
                                     layerAttr(required=True),
-                                    Attr("dtype", required=False),
+                                    Attr("dtype", intern=True, required=False),
                                     widthAttr(required=False), # this is in disagreement with the dtd.  However, Eagle generates <dimensions> with no width attribute.  The default seems to be 0.13mm and if that value is selected, the attribute is omitted.
                                     extwidthAttr(required=False),
                                     extlengthAttr(required=False),
@@ -679,7 +911,7 @@ tags["dimension"] = TagClass("dimension",
                                     Attr("textratio",
                                          vtype="int",
                                          required=False),
-                                    Attr("unit", required=False),
+                                    Attr("unit", intern=True, required=False),
                                     Attr("precision",
                                          vtype="int",
                                          required=False),
@@ -700,7 +932,8 @@ tags["text"] = TagClass("text",
                                Attr("font",
                                     required=False,
                                     vtype="None_is_default_string",
-                                    default="proportional"),
+                                    default="proportional",
+                                    intern=True),
                                Attr("ratio", 
                                     vtype="None_is_default_int",
                                     default=8,
@@ -709,7 +942,8 @@ tags["text"] = TagClass("text",
                                Attr("align",
                                     vtype="None_is_default_string",
                                     default="bottom-left",
-                                    required=False),
+                                    required=False,
+                                    intern=True),
                                Attr("distance", 
                                     vtype="None_is_default_int",
                                     default=50,
@@ -794,7 +1028,7 @@ tags["pad"] = TagClass("pad",
                               dimensionAttr("y",True),
                               drillAttr( required=True),
                               diameterAttr(required=False),
-                              Attr("shape", required=False),
+                              Attr("shape", intern=True, required=False),
                               rotAttr,
                               Attr("stop",
                                    vtype="bool",
@@ -840,14 +1074,15 @@ tags["element"] = TagClass("element",
                            attrs=[nameAttr(),
                                   Attr("library",
                                        required=True,
-                                       lookupEFP=("Library", "lambda efp, key: efp.get_parent().get_library(key)")),
+                                       lookupEFP=("Library", "lambda efp, key: _maybe(_ancestor(efp, 1), 'get_library', key)")),
                                   urnAttr("library_urn"),
                                   Attr("package",
                                        required=True,
-                                       lookupEFP=("Package", "lambda efp, key: efp.find_library().get_package(key)")),
+                                       lookupEFP=("Package", "lambda efp, key: _maybe(efp.find_library(), 'get_package', key)")),
                                   urnAttr("package3d_urn"),
                                   Attr("value",
-                                       required=True),
+                                       required=True,
+                                       intern=True),
                                   dimensionAttr("x",True),
                                   dimensionAttr("y",True),
                                   Attr("locked",
@@ -872,10 +1107,10 @@ tags["via"] = TagClass("via",
                           mixins=["OnePointGeometry", "CircleDiameterGeometry"],
                        attrs=[dimensionAttr("x",True),
                               dimensionAttr("y",True),
-                              Attr("extent", required=True),
+                              Attr("extent", intern=True, required=True),
                               drillAttr( required=True),
                               diameterAttr(required=False),
-                              Attr("shape", required=False),
+                              Attr("shape", intern=True, required=False),
                               Attr("alwaysstop", 
                                    vtype="bool",
                                    required=False)])
@@ -888,7 +1123,7 @@ tags["polygon"] = TagClass("polygon",
                            attrs=[widthAttr( required=True),
                                   layerAttr(required=True),
                                   spacingAttr(required=False),
-                                  Attr("pour", required=False),
+                                  Attr("pour", intern=True, required=False),
                                   isolateAttr(required=False),
                                   Attr("orphans",
                                        vtype="bool",
@@ -923,9 +1158,9 @@ tags["pin"] = TagClass("pin",
                               dimensionAttr("y",True),
                               Attr("visible", 
                                    required=False),
-                              Attr("length", required=False),
-                              Attr("direction", required=False),
-                              Attr("function", required=False),
+                              Attr("length", intern=True, required=False),
+                              Attr("direction", intern=True, required=False),
+                              Attr("function", intern=True, required=False),
                               Attr("swaplevel", 
                                    vtype="int",
                                    required=False),
@@ -938,23 +1173,24 @@ tags["part"] = TagClass("part",
                         customchild=True,
                         attrs=[nameAttr(),
                                Attr("library",
-                                    lookupEFP=("Library", "lambda efp, key: efp.get_parent().get_library(key)"),
+                                    lookupEFP=("Library", "lambda efp, key: _maybe(_ancestor(efp, 1), 'get_library', key)"),
                                     required=True),
                                urnAttr("library_urn"),
                                Attr("deviceset",
-                                    lookupEFP=("Deviceset", "lambda efp, key: efp.find_library().get_deviceset(key)"),
+                                    lookupEFP=("Deviceset", "lambda efp, key: _maybe(efp.find_library(), 'get_deviceset', key)"),
                                     required=True),
                                Attr("device",
-                                    lookupEFP=("Device", "lambda efp, key: efp.find_deviceset().get_device(key)"),
+                                    lookupEFP=("Device", "lambda efp, key: _maybe(efp.find_deviceset(), 'get_device', key)"),
                                     required=True),
                                urnAttr("package3d_urn"),
                                Attr("technology",
-                                    lookupEFP=("Technology","lambda efp, key: efp.find_device().get_technology(key)"),
+                                    lookupEFP=("Technology","lambda efp, key: _maybe(efp.find_device(), 'get_technology', key)"),
                                     required=False,
                                     vtype="None_is_default_string",
                                     default=""),
                                Attr("value",
-                                    required=False)],
+                                    required=False,
+                                    intern=True)],
                         sections=[Map("attributes", "./attribute", requireTag=True),
                                   Map("variants", "./variant")])
 
@@ -966,8 +1202,8 @@ tags["port"] = TagClass("port",
                                Attr("side", 
                                     vtype="int",
                                     required=True),
-                               Attr("dimension", required=True),
-                               Attr("direction", required=False)])
+                               Attr("dimension", intern=True, required=True),
+                               Attr("direction", intern=True, required=False)])
 
 
 
@@ -976,10 +1212,10 @@ tags["instance"] = TagClass("instance",
                             baseclass = "EagleFilePart",
                             mixins=["OnePointGeometry", "RotationGeometry"],
                             attrs=[Attr("part",
-                                        lookupEFP=("Part","lambda efp, key: efp.get_parent().get_parent().get_part(key)"),
+                                        lookupEFP=("Part","lambda efp, key: _maybe(_ancestor(efp, 2), 'get_part', key)"),
                                         required=True),
                                    Attr("gate",
-                                        lookupEFP=("Gate", "lambda efp, key: NotImplemented('Lookup of gate from instance not implemented.')"),
+                                        lookupEFP=("Gate", "lambda efp, key: _maybe(_maybe(efp.find_part(), 'find_deviceset'), 'get_gate', key)"),
                                         required=True),
                                    dimensionAttr("x",True),
                                    dimensionAttr("y",True),
@@ -996,7 +1232,7 @@ tags["label"] = TagClass("label",
                                 dimensionAttr("y",True),
                                 sizeAttr(required=True),
                                 layerAttr(required=True),
-                                Attr("font", required=False),
+                                Attr("font", intern=True, required=False),
                                 Attr("ratio",
                                      vtype="int",
                                       required=False),
@@ -1018,15 +1254,15 @@ tags["junction"] = TagClass("junction",
 tags["connect"] = TagClass("connect",
                            baseclass = "EagleFilePart",
                            attrs=[Attr("gate",
-                                       lookupEFP=("Gate","lambda efp, key: NotImplemented('Lookup of gate from connect not implemented.')"),
+                                       lookupEFP=("Gate","lambda efp, key: _maybe(_ancestor(efp, 2), 'get_gate', key)"),
                                        required=True),
                                   Attr("pin",
-                                       lookupEFP=("Pin","lambda efp, key: NotImplemented('Lookup of pin from connect not implemented.')"),
+                                       lookupEFP=("Pin","lambda efp, key: _maybe(_maybe(efp.find_gate(), 'find_symbol'), 'get_pin', key)"),
                                        required=True),
                                   # Attr("pad",
                                   #      lookupEFP=("Pad","lambda efp, key: NotImplemented('Lookup of pad from connect not implemented.')"),
                                   #      required=True),
-                                  Attr("route", required=False)],
+                                  Attr("route", intern=True, required=False)],
                            sections=[AttrList("pads", "pad", "pad")])
 
 
@@ -1043,13 +1279,13 @@ tags["technology"] = TagClass("technology",
 tags["attribute"] = TagClass("attribute",
                              baseclass = "EagleFilePart",
                              customchild = True,
-                             attrs=[nameAttr(),
-                                    Attr("value", required=False),
+                             attrs=[nameAttr(intern=True),
+                                    Attr("value", intern=True, required=False),
                                     dimensionAttr("x", required=False),
                                     dimensionAttr("y", required=False),
                                     sizeAttr(required=False),
                                     layerAttr(required=False),
-                                    Attr("font", required=False),
+                                    Attr("font", intern=True, required=False),
                                     Attr("ratio",
                                          vtype="int",
                                          required=False),
@@ -1057,7 +1293,7 @@ tags["attribute"] = TagClass("attribute",
                                     Attr("display",
                                          vtype="display_bool",
                                          required=False),
-                                    Attr("align", required=False), # SS: not in the standard DTD
+                                    Attr("align", intern=True, required=False), # SS: not in the standard DTD
                                     Attr("constant",
                                          vtype="constant_bool",
                                          required=False)])
@@ -1067,13 +1303,13 @@ tags["attribute"] = TagClass("attribute",
 tags["pinref"] = TagClass("pinref",
                           baseclass = "EagleFilePart",
                           attrs=[Attr("part",
-                                      lookupEFP=("Part","lambda efp, key: NotImplemented('Lookup of part from pinref not implemented.')"),
+                                      lookupEFP=("Part","lambda efp, key: _maybe(_ancestor(efp, 4), 'get_part', key)"),
                                       required=True),
                                  Attr("gate",
-                                      lookupEFP=("Gate","lambda efp, key: NotImplemented('Lookup of gate from pinref not implemented.')"),
+                                      lookupEFP=("Gate","lambda efp, key: _maybe(_maybe(efp.find_part(), 'find_deviceset'), 'get_gate', key)"),
                                       required=True),
                                  Attr("pin",
-                                      lookupEFP=("Pin", "lambda efp, key: NotImplemented('Lookup of pin from pinref not implemented.')"),
+                                      lookupEFP=("Pin", "lambda efp, key: _maybe(_maybe(efp.find_gate(), 'find_symbol'), 'get_pin', key)"),
                                       required=True)])
 
 
@@ -1081,12 +1317,12 @@ tags["pinref"] = TagClass("pinref",
 tags["contactref"] = TagClass("contactref",
                               baseclass = "EagleFilePart",
                               attrs=[Attr("element",
-                                          lookupEFP=("Element","lambda efp, key: NotImplemented('Lookup of element from contactref not implemented.')"),
+                                          lookupEFP=("Element","lambda efp, key: _maybe(_ancestor(efp, 2), 'get_element', key)"),
                                           required=True),
                                      Attr("pad",
-                                          lookupEFP=("Pad","lambda efp, key: NotImplemented('Lookup of pad from contactref not implemented.')"),
+                                          lookupEFP=("Pad","lambda efp, key: _find_contact(_maybe(efp.find_element(), 'find_package'), key)", ["Smd"]),
                                           required=True),
-                                     Attr("route", required=False),
+                                     Attr("route", intern=True, required=False),
                                      Attr("routetag", required=False)])
 
 
@@ -1094,10 +1330,10 @@ tags["contactref"] = TagClass("contactref",
 tags["portref"] = TagClass("portref",
                            baseclass = "EagleFilePart",
                            attrs=[Attr("moduleinst",
-                                       lookupEFP=("Moduleinst","lambda efp, key: NotImplemented('Lookup of moduleinst from portref not implemented.')"),
+                                       lookupEFP=("Moduleinst","lambda efp, key: _maybe(_ancestor(efp, 3), 'get_moduleinst', key)"),
                                        required=True),
                                   Attr("port",
-                                       lookupEFP=("Port", "lambda efp, key: NotImplemented('Lookup of port from portref not implemented.')"),
+                                       lookupEFP=("Port", "lambda efp, key: _maybe(_maybe(efp.find_moduleinst(), 'find_module'), 'get_port', key)"),
                                        required=True)])
 
 
@@ -1170,7 +1406,7 @@ tags["layer"] = TagClass("layer",
 
 tags["class"] = TagClass("class",
                          baseclass = "EagleFilePart",
-                         attrs=[Attr("number", required=True),
+                         attrs=[Attr("number", required=True, isRefKey=True),
                                 nameAttr(),
                                 widthAttr(required=False),
                                 drillAttr(required=False)],
@@ -1184,7 +1420,7 @@ tags["clearance"] = TagClass("clearance",
                                          isKey=True,
                                          accessorName = "class",
                                          xmlName="class",
-                                         lookupEFP=("Class","lambda efp, key: NotImplemented('Lookup of class from clearance not implemented.')"),
+                                         lookupEFP=("Class","lambda efp, key: _find_class(_ancestor(efp, 2), key)"),
                                          required=True),
                                     dimensionAttr("value", required=False)])
 
@@ -94,8 +94,9 @@ def main(cmdline_args=None):
         try:
             # for the internal check, we compare the input and output.  With
             # bestEffort == True, we can successfully parse illegal input, but
-            # since we always produce legal output, they won't match.
-            f = HE.EagleFile.from_file(i, bestEffort=(not args.internalCheck))
+            # since we always produce legal output, they won't match.  The
+            # comparison also needs the source XML, so only keep it then.
+            f = HE.EagleFile.from_file(i, bestEffort=(not args.internalCheck), retainSource=args.internalCheck)
             #f.write(i+".xml")
             if f.validate():
                 goodSoFar = True
@@ -24,84 +24,41 @@ def removeDeadEFPs(ef):
 
     """
 
-    deletedSomething = True;
-    while deletedSomething:
-        deletedSomething = False
-        packages = set()
-        symbols = set()
-        devices = set()
-        devicesets = set()
-        libraries = set()
-
-        if isinstance(ef, Swoop.LibraryFile):
-            libs = [ef.get_library()]
-        else:
-            libs = ef.get_libraries()
-            
-        
-        for l in libs:
-            libraries.add(l)
-
-            for s in Swoop.From(l).get_symbols():
-                symbols.add(s)
-
-            for p in Swoop.From(l).get_packages():
-                #print "found " + p.get_name()
-                packages.add(p)
-            
-            for ds in Swoop.From(l).get_devicesets():
-                devicesets.add(ds)
-
-                for d in ds.get_devices():
-                    devices.add(d)
-
-                for g in ds.get_gates():
-                    symbols.discard(g.find_symbol())
-
-                for d in ds.get_devices():
-                    if d.get_package() is not None:
-                        packages.discard(d.find_package())
-                        
-        if isinstance(ef, Swoop.SchematicFile):
-            for p in Swoop.From(ef).get_parts():
-                lib = p.find_library()
-                libraries.discard(lib)
-                devicesets.discard(p.find_deviceset())
-                devices.discard(p.find_device())
-                # print p.get_name()
-                # print p.get_library()
-                # print lib.get_name()
-                # print p.get_deviceset()
-                # print Swoop.From(lib.get_devicesets()).get_name()
-                # print p.find_deviceset().get_name()
-                # print
-                for g in Swoop.From(p.find_deviceset()).get_gates().get_symbol():
-                    symbols.discard(lib.get_symbol(g))
-
-        elif isinstance(ef, Swoop.BoardFile):
-            for p in Swoop.From(ef).get_elements():
-                lib = p.find_library()
-                #print "keeping " + lib.get_name()
-                libraries.discard(lib)
-                #print "keeping " + p.get_package()
-                #print "keeping " + p.find_package().get_name()
-                packages.discard(p.find_package())
-                #assert Swoop.From(libs).get_packages().with_name("ROTARY-ENCODER-W/BUTTON-ADAFRUIT377").count() > 0
-        elif isinstance(ef, Swoop.LibraryFile):
-            lib = ef.get_library();
-            libraries.discard(lib)
-            for s in Swoop.From(lib).get_devicesets().get_gates().get_symbol():
-                symbols.discard(lib.get_symbol(s))
-            for p in Swoop.From(lib).get_devicesets().get_devices().get_package():
-                packages.discard(lib.get_package(p))
-            for p in Swoop.From(lib).get_devicesets().get_devices():
-                devices.discard(p)
-            for ds in Swoop.From(lib).get_devicesets():
-                devicesets.discard(ds)
-        for l in [packages,symbols , devices , devicesets , libraries]:
-            for efp in l:
+    # A part is unused if nothing refers to it.  Removing it can leave the
+    # parts it refers to unused (e.g., the symbols of a deviceset's gates),
+    # so repeat until nothing changes.  get_referrers() keeps its indexes up
+    # to date as we remove things, so each pass takes linear time.  Drop the
+    # indexes it created when we're done, since they'd slow down later
+    # changes to the file.
+    indexes = ef.get_indexes()
+    try:
+        deletedSomething = True;
+        while deletedSomething:
+            deletedSomething = False
+
+            if isinstance(ef, Swoop.LibraryFile):
+                libs = [ef.get_library()]
+            else:
+                libs = ef.get_libraries()
+
+            dead = []
+            for l in libs:
+                candidates = l.get_symbols() + l.get_packages()
+                if not isinstance(ef, Swoop.LibraryFile):
+                    # Library files keep their devices, devicesets, and library.
+                    candidates.append(l)
+                    for ds in l.get_devicesets():
+                        candidates.append(ds)
+                        candidates += ds.get_devices()
+                dead += [efp for efp in candidates if not ef.get_referrers(efp)]
+
+            for efp in dead:
                 deletedSomething = True
                 efp.detach()
+    finally:
+        for cls, attr in ef.get_indexes():
+            if (cls, attr) not in indexes:
+                ef.drop_index(cls, attr)
     return ef
         
 def main(argv = None):
@@ -112,7 +69,7 @@ def main(argv = None):
     parser.add_argument("--out", required=True,  type=str, nargs=1, dest='out', help="output file")
     args = parser.parse_args(argv)
     
-    ef = Swoop.EagleFile.from_file(args.file[0])
+    ef = Swoop.EagleFile.from_file(args.file[0], retainSource=False)
 
     removeDeadEFPs(ef)
 
@@ -14,11 +14,11 @@ def main():
     args = parser.parse_args()
     
     if args.layers:
-        layers = Swoop.LibraryFile.from_file(args.layers[0])
+        layers = Swoop.LibraryFile.from_file(args.layers[0], retainSource=False)
 
     for f in args.file:
 
-        ef = Swoop.EagleFile.from_file(f)
+        ef = Swoop.EagleFile.from_file(f, retainSource=False)
 
 
         if args.layers:
@@ -33,11 +33,11 @@ def main():
     else:
         log.basicConfig(format="%(levelname)s: %(message)s")
 
-    layers = Swoop.LibraryFile.from_file(args.layers)
+    layers = Swoop.LibraryFile.from_file(args.layers, retainSource=False)
     new_layers = Swoop.From(layers).get_layers()
 
     for f in args.file:
-        ef = Swoop.EagleFile.from_file(f)
+        ef = Swoop.EagleFile.from_file(f, retainSource=False)
 
         for newl in new_layers:
             try:
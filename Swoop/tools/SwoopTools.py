@@ -15,9 +15,10 @@ class ScanLayersVisitor(Swoop.EagleFilePartVisitor):
         self.definedLayers = set()
 
     def default_pre(self, efp):
-        if "layer" in efp.__dict__ and efp.layer is not None:
-            assert type(efp.layer) == str
-            self.foundLayers.add(efp.layer)
+        layer = getattr(efp, "layer", None)
+        if layer is not None:
+            assert type(layer) == str
+            self.foundLayers.add(layer)
 
     def Layer_pre(self, efp):
         assert type(efp) == Swoop.Layer
@@ -168,13 +169,11 @@ def rebuildBoardConnections(sch, brd):
                        get_segments().
                        get_pinrefs()):
 
-            if sch.get_part(pinref.part).find_device().get_package() is None:
+            device = pinref.find_part().find_device()
+            if device.get_package() is None:
                 continue
 
-            pads = (Swoop.From(sch).
-                   get_parts().
-                   with_name(pinref.get_part()).
-                   find_device().
+            pads = (Swoop.From(device).
                    get_connects().
                    with_gate(pinref.gate).
                    with_pin(pinref.pin).
@@ -401,6 +400,19 @@ def quick_bom(schematic):
         parts[p.get_name()] = attrs
     return parts
 
+def _with_ignore_case(query, efile, cls, attr, v):
+    """Return the members of :code:`query` (:code:`cls` objects in
+    :code:`efile`) whose :code:`attr` equals :code:`v`, ignoring case.  If
+    :code:`efile` has an index on :code:`attr` (see
+    :meth:`EagleFile.create_index`), use it to find the spellings of
+    :code:`v` and look each one up, rather than checking every member.
+
+    """
+    values = efile.get_index_values(cls, attr, v)
+    if values is None:
+        return [x for x in query if getattr(x, "get_" + attr)().upper() == v.upper()]
+    return [x for value in values for x in getattr(query, "with_" + attr)(value)]
+
 def rename_part(old, new, schematic=None, board=None):
     """Rename a part in a schematic and the corresponding board, if provided.
     Change the name of the part and update all references to it.
@@ -410,28 +422,28 @@ def rename_part(old, new, schematic=None, board=None):
     :param old: Old part name.
     :param new: New part name.
 
+    References are matched ignoring case.  They are found with the indexes
+    created with :meth:`EagleFile.create_index`, if there are any (see
+    :func:`rationalize_refdes`).
+
     """
     
     if schematic is not None:
         old_part = schematic.get_part(old)
         old_part.set_name(new)
         
-        for i in Swoop.From(schematic).get_sheets().get_instances():
-            if i.get_part().upper() == old.upper():
-                i.set_part(new.upper())
+        for i in _with_ignore_case(Swoop.From(schematic).get_sheets().get_instances(), schematic, Swoop.Instance, "part", old):
+            i.set_part(new.upper())
                 
-        for pinref in Swoop.From(schematic).get_sheets().get_nets().get_segments().get_pinrefs():
-            if pinref.get_part().upper() == old.upper():
-                pinref.set_part(new.upper())
+        for pinref in _with_ignore_case(Swoop.From(schematic).get_sheets().get_nets().get_segments().get_pinrefs(), schematic, Swoop.Pinref, "part", old):
+            pinref.set_part(new.upper())
                         
     if board is not None:
-        for e in Swoop.From(board).get_elements():
-            if e.get_name().upper() == old.upper():
-                e.set_name(new.upper())
+        for e in _with_ignore_case(Swoop.From(board).get_elements(), board, Swoop.Element, "name", old):
+            e.set_name(new.upper())
 
-        for contact_ref in Swoop.From(board).get_signals().get_contactrefs():
-            if contact_ref.get_element().upper() == old.upper():
-                contact_ref.set_element(new.upper())
+        for contact_ref in _with_ignore_case(Swoop.From(board).get_signals().get_contactrefs(), board, Swoop.Contactref, "element", old):
+            contact_ref.set_element(new.upper())
 
 def rationalize_refdes(schematic=None, board=None):
     """
@@ -441,21 +453,35 @@ def rationalize_refdes(schematic=None, board=None):
     :param board: :class:`BoardFile` to process
     :returns: A map from old part names to new part names.
     """
+    # Index the references to parts while we rename them, so each rename
+    # doesn't have to visit the whole design.
+    indexes = [(f, cls, attr) for f, cls, attr in [(schematic, Swoop.Instance, "part"),
+                                                    (schematic, Swoop.Pinref, "part"),
+                                                    (board, Swoop.Element, "name"),
+                                                    (board, Swoop.Contactref, "element")]
+               if f is not None and not f.has_index(cls, attr)]
+    for f, cls, attr in indexes:
+        f.create_index(cls, attr)
+
     prefix_counts = {}
     rename_map = {}
-    for p in Swoop.From(schematic).get_parts():
-        prefix = p.find_deviceset().get_prefix()
-        if prefix is None:
-            prefix = "U"
-
-        before = p.get_name()
-        after = "{}{}".format(prefix,prefix_counts.setdefault(prefix,1))
-        
-        rename_map[before] = after
-        rename_part(before,
-                    after,
-                    board=board,schematic=schematic)
-        prefix_counts[prefix] += 1
+    try:
+        for p in Swoop.From(schematic).get_parts():
+            prefix = p.find_deviceset().get_prefix()
+            if prefix is None:
+                prefix = "U"
+
+            before = p.get_name()
+            after = "{}{}".format(prefix,prefix_counts.setdefault(prefix,1))
+
+            rename_map[before] = after
+            rename_part(before,
+                        after,
+                        board=board,schematic=schematic)
+            prefix_counts[prefix] += 1
+    finally:
+        for f, cls, attr in indexes:
+            f.drop_index(cls, attr)
     return rename_map
 
 
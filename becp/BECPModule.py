@@ -35,9 +35,8 @@ class BECPModule (object):
         
                 
     def rename_net (self, old_name, new_name):
-        for n in swp.From(self.swoop_sch).get_sheets().get_nets():
-            if n.get_name() == old_name:
-                n.set_name(new_name)
+        for n in swp.From(self.swoop_sch).get_sheets().get_nets().with_name(old_name):
+            n.set_name(new_name)
                 
     def new_net (self, new_net_name, net_class = 0, sheet_number = 0):
         if new_net_name in swp.From(self.swoop_sch).get_sheets().get_nets().get_name():
@@ -62,13 +61,11 @@ class BECPModule (object):
             self.parts[new_name].set_name(new_name)
             assert (self.parts[new_name] is not None)
             
-            for i in swp.From(self.swoop_sch).get_sheets().get_instances():
-                if i.get_part() == old_name:
-                    i.set_part(new_name)
+            for i in swp.From(self.swoop_sch).get_sheets().get_instances().with_part(old_name):
+                i.set_part(new_name)
                     
-            for pr in swp.From(self.swoop_sch).get_sheets().get_nets().get_segments().get_pinrefs():
-                if pr.get_part() == old_name:
-                    pr.set_part(new_name)
+            for pr in swp.From(self.swoop_sch).get_sheets().get_nets().get_segments().get_pinrefs().with_part(old_name):
+                pr.set_part(new_name)
         
     def process (self):
         pass
@@ -3,20 +3,27 @@ import Swoop.tools
 import os
 import re
 import math
+import shutil
+import tempfile
 
 #from bin.cleanupEagle import main
 from Swoop import *
 
-from Swoop.tools.CleanupEagle import main
+from Swoop.tools.CleanupEagle import main, removeDeadEFPs
 
 class TestCleanup(unittest.TestCase):
 
     def setUp(self):
         self.me = os.path.dirname(os.path.realpath(__file__))
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
 
     def test_Schematic(self):
-        main(["--file", self.me + "/inputs/cleanup_test01.sch", "--out", self.me + "/inputs/cleanup_test01.out.sch"])
-        ef = EagleFile.from_file(self.me + "/inputs/cleanup_test01.out.sch")
+        out = os.path.join(self.tmpdir, "cleanup_test01.out.sch")
+        main(["--file", self.me + "/inputs/cleanup_test01.sch", "--out", out])
+        ef = EagleFile.from_file(out)
         self.assertEqual(From(ef).get_libraries().count(), 6, "Wrong number of libraries")
         self.assertEqual(From(ef).get_libraries().get_packages().count(), 3, "Wrong number of packages")
         self.assertEqual(From(ef).get_libraries().get_symbols().count(), 10, "Wrong number of symbols")
@@ -24,8 +31,9 @@ class TestCleanup(unittest.TestCase):
         self.assertEqual(From(ef).get_libraries().get_devicesets().get_devices().count(), 9, "Wrong number of devices")
 
     def test_Board(self):
-        main(["--file", self.me + "/inputs/cleanup_test01.brd", "--out", self.me + "/inputs/cleanup_test01.out.brd"])
-        ef = EagleFile.from_file(self.me + "/inputs/cleanup_test01.out.brd")
+        out = os.path.join(self.tmpdir, "cleanup_test01.out.brd")
+        main(["--file", self.me + "/inputs/cleanup_test01.brd", "--out", out])
+        ef = EagleFile.from_file(out)
         self.assertEqual(From(ef).get_libraries().count(), 1, "Wrong number of libraries")
         self.assertEqual(From(ef).get_libraries().get_packages().count(), 3, "Wrong number of packages")
         self.assertEqual(From(ef).get_libraries().get_symbols().count(), 0, "Wrong number of symbols")
@@ -34,11 +42,18 @@ class TestCleanup(unittest.TestCase):
         
     
     def test_Library(self):
-        main(["--file", self.me + "/inputs/cleanup_test01.lbr", "--out", self.me + "/inputs/cleanup_test01.out.lbr"])
-        ef = EagleFile.from_file(self.me + "/inputs/cleanup_test01.out.lbr")
+        out = os.path.join(self.tmpdir, "cleanup_test01.out.lbr")
+        main(["--file", self.me + "/inputs/cleanup_test01.lbr", "--out", out])
+        ef = EagleFile.from_file(out)
         self.assertEqual(From(ef).get_library().get_packages().count(), 35, "Wrong number of packages")
         self.assertEqual(From(ef).get_library().get_symbols().count(), 97, "Wrong number of symbols")
         self.assertEqual(From(ef).get_library().get_devicesets().count(),96, "Wrong number of devicesets")
         self.assertEqual(From(ef).get_library().get_devicesets().get_devices().count(), 101, "Wrong number of devices")
+
+    def test_DropsIndexes(self):
+        ef = EagleFile.from_file(self.me + "/inputs/cleanup_test01.sch")
+        ef.create_index(Pinref, "part")
+        removeDeadEFPs(ef)
+        self.assertEqual(ef.get_indexes(), [(Pinref, "part")])
         
     
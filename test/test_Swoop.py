@@ -2,6 +2,7 @@ import unittest
 import Swoop
 import Swoop.tools
 import os
+import sys
 import re
 import math
 from lxml import etree as ET
@@ -196,6 +197,58 @@ class TestSwoop(unittest.TestCase):
             self.assertTrue(False, "write to string failed")
             raise e
 
+    def test_StreamingWrite(self):
+        import io
+        for ef in [self.sch, self.brd, self.lbr]:
+            validated = io.BytesIO()
+            ef.write(validated)
+            streamed = io.BytesIO()
+            ef.write(streamed, dtd_validate=False)
+            self.assertEqual(streamed.getvalue(), validated.getvalue(), "Streaming write changed output")
+            self.assertTrue(streamed.getvalue().endswith(ef.get_xml(pretty_print=True)))
+
+            text = io.StringIO()
+            ef.write(text, dtd_validate=False)
+            self.assertEqual(text.getvalue().encode("utf8"), streamed.getvalue(), "Writing to text stream failed")
+
+        # Validation happens as the file is written.
+        sch = self.sch.clone().set_filename(None)
+        Swoop.From(sch).get_libraries().get_symbols().get_drawing_elements().with_type(Swoop.Wire).first().set_style("bogus")
+        with self.assertRaises(Swoop.SwoopError):
+            sch.write(io.BytesIO())
+        sch.write(io.BytesIO(), dtd_validate=False)
+
+    def test_WriteRejectsNone(self):
+        import io
+        sch = self.sch.clone().set_filename(None)
+        path = os.path.join(self.tmpdir, "none.sch")
+        sch.write(path)
+        with open(path, "rb") as f:
+            before = f.read()
+        Swoop.From(sch).get_parts().first().set_value("None")
+        with self.assertRaises(Swoop.SwoopError):
+            sch.write(io.BytesIO())
+        # A file that's written by name is left alone.
+        with self.assertRaises(Swoop.SwoopError):
+            sch.write(path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before, "Invalid write replaced the file")
+        self.assertEqual(os.listdir(self.tmpdir).count("none.sch.swoop.tmp"), 0)
+        self.assertEqual(sch.validate(), False, "'None' attribute not detected")
+
+    def test_WriteKeepsFileMode(self):
+        path = os.path.join(self.tmpdir, "mode.sch")
+        link = os.path.join(self.tmpdir, "link.sch")
+        for p in [path, link]:
+            if os.path.lexists(p):
+                os.remove(p)
+        self.sch.write(path)
+        os.chmod(path, 0o640)
+        os.symlink(path, link)
+        self.sch.write(link)
+        self.assertTrue(os.path.islink(link), "Symlink replaced")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640, "File mode lost")
+
     def test_TypeCheck(self):
         sch = self.sch.clone()
 
@@ -208,6 +261,46 @@ class TestSwoop(unittest.TestCase):
         l.set_name("foo")
         l.set_number(1999)
 
+        a = Swoop.Attribute().set_name("foo")
+        sch.get_parts()[0].add_attribute(a)
+        a.set_display(False)
+        self.assertEqual(a.get_xml(), '<attribute name="foo" display="off"/>'.encode('utf8'))
+        with self.assertRaises(Swoop.SwoopError):
+            a.set_display("off")
+
+    def test_StreamOpen(self):
+        with open(self.sch_file, "rb") as f:
+            data = f.read()
+        with open(self.sch_file, "rb") as f:
+            sources = [f, data, bytearray(data), memoryview(data)]
+            for s in sources:
+                sch = Swoop.EagleFile.from_stream(Swoop.SchematicFile, s)
+                self.assertEqual(sch.get_xml(), self.sch.get_xml(), "Loading from {} failed".format(type(s).__name__))
+
+    def test_RetainSource(self):
+        self.assertIsNotNone(self.sch.root, "Source XML dropped")
+        self.assertIsNotNone(self.sch.get_libraries()[0].root, "Source XML dropped")
+        sch = Swoop.EagleFile.from_file(self.sch_file, retainSource=False)
+        self.assertIsNone(sch.root, "Source XML retained")
+        self.assertEqual(len(Swoop.From(sch).get_libraries().get_packages().filtered_by(lambda x: x.root is not None)), 0, "Source XML retained")
+        self.assertEqual(sch.get_xml(), self.sch.get_xml(), "Dropping source XML changed file contents")
+
+    def test_DTDCache(self):
+        Swoop.EagleFile.preload_DTDs(["7.2.0"])
+        dtd = Swoop.EagleFile.get_DTD(self.sch.get_et())
+        self.assertIs(Swoop.EagleFile.get_DTD(self.brd.get_et()), dtd, "DTD parsed twice")
+        self.assertTrue(self.sch.validate()[0], "Validation with cached DTD failed")
+
+    def test_BadValue(self):
+        sch = ET.parse(self.sch_file)
+        sch.find(".//sheets//wire").set("width", "wide")
+        with self.assertRaises(Swoop.SwoopError):
+            Swoop.SchematicFile._from_et(sch.getroot(), None)
+        try:
+            Swoop.SchematicFile._from_et(sch.getroot(), None)
+        except Swoop.SwoopError as e:
+            self.assertTrue("Bad value: 'wide' should be float" in str(e), "Wrong error message: " + str(e))
+
 
     def test_ConstantAttrs(self):
         sch = self.sch.clone()
@@ -243,7 +336,7 @@ class TestSwoop(unittest.TestCase):
     def test_Clone(self):
         a = Swoop.EagleFile.from_file(os.path.join(self.me, "inputs/Trinket_Pro_default_SMD_parts_power_breakout.koala.sch"))
         a.clone()
-        a.write("foo.sch")
+        a.write(os.path.join(self.tmpdir, "foo.sch"))
 
         for a in [self.brd, self.sch, self.lbr]:
             b = a.clone()
@@ -291,3 +384,630 @@ class TestSwoop(unittest.TestCase):
         self.assertEqual(self.sch.get_mirrored_layer(22), 21, "Layer mirroring error")
         self.assertEqual(self.sch.get_mirrored_layer(20), 20, "Layer mirroring error")
         self.assertEqual(self.sch.get_mirrored_layer(100), 100, "Layer mirroring error")
+
+    def test_LazyLoad(self):
+        for f, ef in [(self.sch_file, self.sch), (self.brd_file, self.brd), (self.lbr_file, self.lbr)]:
+            lazy = Swoop.EagleFile.from_file(f, lazy=True)
+            self.assertEqual(lazy.get_xml(), ef.get_xml(), "Lazy load changed file contents")
+
+        lazy = Swoop.EagleFile.from_file(self.sch_file, lazy=True)
+        self.assertIn("libraries", lazy._pending, "Libraries loaded eagerly")
+        lib = lazy.get_library("KoalaBuild")
+        self.assertNotIn("libraries", lazy._pending, "Libraries not loaded")
+        self.assertIn("packages", lib._pending, "Packages loaded eagerly")
+        self.assertEqual(Swoop.From(lib).get_package("CAPC1608X90_HS").get_drawing_elements().with_layer("tCream").count(), 2, "Lazy search failure")
+
+        pkg = lib.get_package("CAPC1608X90_HS")
+        pkg.detach()
+        self.assertEqual(sorted([x.get_layer() for x in pkg.get_drawing_elements()]),
+                         sorted([x.get_layer() for x in self.sch.get_library("KoalaBuild").get_package("CAPC1608X90_HS").get_drawing_elements()]),
+                         "Detached lazy part loaded incorrectly")
+
+    def test_SnapshotCache(self):
+        cacheDir = os.path.join(self.tmpdir, "cache")
+        old = Swoop.EagleFile.snapshotCacheDir
+        Swoop.EagleFile.snapshotCacheDir = cacheDir
+        try:
+            for f, ef in [(self.sch_file, self.sch), (self.lbr_file, self.lbr)]:
+                a = Swoop.EagleFile.from_file(f, retainSource=False)
+                self.assertEqual(len(os.listdir(cacheDir)), 1, "Snapshot not saved")
+                self.assertIsNotNone(type(a)._load_snapshot(os.path.join(cacheDir, os.listdir(cacheDir)[0])), "Snapshot not loadable")
+                b = Swoop.EagleFile.from_file(f, retainSource=False)
+                self.assertIsNot(a, b)
+                self.assertEqual(b.get_filename(), f)
+                self.assertEqual(b.get_xml(), ef.get_xml(), "Snapshot changed file contents")
+
+                ext = Swoop.Mixin(object, "Snap")
+                ext.from_file(f, retainSource=False)
+                c = ext.from_file(f, retainSource=False)
+                self.assertEqual(type(c).__name__, "Snap" + type(ef).__name__, "Snapshot ignored Mixin")
+                self.assertEqual(len(os.listdir(cacheDir)), 2, "Mixin shared a snapshot")
+                self.assertEqual(c.get_xml(), ef.get_xml(), "Snapshot changed file contents")
+                for n in os.listdir(cacheDir):
+                    os.remove(os.path.join(cacheDir, n))
+
+            # Corrupt snapshots are ignored.
+            Swoop.EagleFile.from_file(self.lbr_file, retainSource=False)
+            for n in os.listdir(cacheDir):
+                with open(os.path.join(cacheDir, n), "wb") as f:
+                    f.write(b"garbage")
+            self.assertEqual(Swoop.EagleFile.from_file(self.lbr_file, retainSource=False).get_xml(), self.lbr.get_xml())
+            for n in os.listdir(cacheDir):
+                os.remove(os.path.join(cacheDir, n))
+
+            # Snapshots can't refer to anything but Swoop's classes and a few builtin ones.
+            module = sys.modules[Swoop.EagleFile.__module__]
+            Swoop.EagleFile.from_file(self.lbr_file, retainSource=False)
+            marker = os.path.join(self.tmpdir, "snapshot_ran_code")
+            class Evil(object):
+                def __reduce__(self):
+                    return (open, (marker, "w"))
+            for n in os.listdir(cacheDir):
+                with open(os.path.join(cacheDir, n), "wb") as f:
+                    module.pickle_module.dump(Evil(), f, 2)
+            self.assertEqual(Swoop.EagleFile.from_file(self.lbr_file, retainSource=False).get_xml(), self.lbr.get_xml())
+            self.assertFalse(os.path.exists(marker), "Snapshot ran arbitrary code")
+            for n in os.listdir(cacheDir):
+                os.remove(os.path.join(cacheDir, n))
+            self.assertIs(module._find_snapshot_global("Swoop.DRU", "DRUFile"), Swoop.DRUFile)
+            for bad in [("os", "system"), ("__builtin__", "eval"), ("builtins", "eval"), ("__builtin__", "file"),
+                        ("Swoop.Swoop", "os"), ("Swoop.Swoop", "reduce"), ("Swoop.Swoop", "ET.parse")]:
+                self.assertRaises(module.pickle_module.UnpicklingError, module._find_snapshot_global, *bad)
+
+            # If Swoop's source can't be read, the cache isn't used.
+            get_swoop_digest = module._get_swoop_digest
+            def unreadable():
+                raise IOError("unreadable")
+            module._get_swoop_digest = unreadable
+            try:
+                self.assertEqual(Swoop.EagleFile.from_file(self.lbr_file, retainSource=False).get_xml(), self.lbr.get_xml())
+            finally:
+                module._get_swoop_digest = get_swoop_digest
+            self.assertEqual(os.listdir(cacheDir), [])
+        finally:
+            Swoop.EagleFile.snapshotCacheDir = old
+
+    def test_Slots(self):
+        wire = Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_wires()[0]
+        self.assertFalse(hasattr(wire, "__dict__"), "Generated classes should use __slots__")
+        with self.assertRaises(AttributeError):
+            wire.foo = 1
+
+        class Extra(object):
+            pass
+        ext = Swoop.Mixin(Extra, "Extra")
+        wire = Swoop.From(ext.from_file(self.sch_file)).get_sheets().get_nets().get_segments().get_wires()[0]
+        wire.foo = 1
+        self.assertEqual(wire.foo, 1, "Mixin classes should accept new attributes")
+
+    def test_Intern(self):
+        pkgs = [e.get_package() for e in self.brd.get_elements() if e.get_package() == "RESAD1160W55L680D260_HS"]
+        self.assertGreater(len(pkgs), 1)
+        self.assertTrue(all(p is pkgs[0] for p in pkgs), "Package names not interned")
+        libs = [p.get_library() for p in self.sch.get_parts() if p.get_library() == "KoalaBuild"]
+        self.assertTrue(all(l is libs[0] for l in libs), "Library names not interned")
+
+    def test_SortCache(self):
+        brd = self.brd.clone()
+        brd.get_xml()
+        plain = brd.get_plain_elements()
+        wires = [x for x in plain if isinstance(x, Swoop.Wire)]
+        self.assertIs(brd._get_sorted("plain_elements"), brd._get_sorted("plain_elements"), "Order not cached")
+
+        def check(efp, name):
+            c = getattr(efp, name)
+            members = list(c.values()) if isinstance(c, dict) else c
+            self.assertEqual(efp._get_sorted(name), sorted(members, key=lambda x: x.sortkey()), "Cached order is stale")
+
+        brd.add_plain_element(wires[1].clone().set_x1(1000.0))
+        brd.remove_plain_element(wires[2])
+        check(brd, "plain_elements")
+        wires[0].set_x1(-1000.0)
+        check(brd, "plain_elements")
+
+        # Replacing a member of a map, and renaming one.
+        lib = brd.get_libraries()[0]
+        packages = lib.get_packages()
+        check(lib, "packages")
+        lib.add_package(packages[0].clone())
+        check(lib, "packages")
+        self.assertEqual(len(lib._get_sorted("packages")), len(packages))
+        packages[1].set_name("ZZZ" + packages[1].get_name())
+        check(lib, "packages")
+        self.assertEqual(lib._get_sorted_keys("packages"), sorted(lib.packages))
+
+    def test_IncrementalWrite(self):
+        import io
+        brd = self.brd.clone()
+        brd.write(io.BytesIO(), incremental=True)
+        self.assertIsNotNone(brd._xml_cache, "XML not cached")
+        lib = brd.get_libraries()[0]
+        self.assertIsNotNone(lib._xml_cache, "XML not cached")
+
+        wire = Swoop.From(brd).get_signals().get_wires().first()
+        wire.set_width(1.5)
+        self.assertIsNone(brd._xml_cache, "Change not propagated")
+        self.assertIsNotNone(lib._xml_cache, "Unchanged XML discarded")
+        brd.get_nth_element(0).set_x(10.0)
+        lib.get_packages()[0].get_drawing_elements()[0].detach()
+        brd.get_layer("tPlace").set_color(3)
+
+        for dtd_validate in [True, False]:
+            out = io.BytesIO()
+            brd.write(out, dtd_validate=dtd_validate, incremental=True)
+            fresh = io.BytesIO()
+            brd.clone().write(fresh, dtd_validate=dtd_validate)
+            self.assertEqual(out.getvalue(), fresh.getvalue(), "Stale XML reused")
+
+        # Plain writes see changes made without the mutators.
+        element = brd.get_nth_element(0)
+        element.value = "DIRECT"
+        element.x = -50.0
+        out = io.BytesIO()
+        brd.write(out)
+        self.assertIn(b'value="DIRECT"', out.getvalue())
+        fresh = io.BytesIO()
+        brd.clone().write(fresh)
+        self.assertEqual(out.getvalue(), fresh.getvalue(), "Stale XML written")
+
+    def test_Hash(self):
+        lib = self.brd.get_libraries()[0].clone()
+        pkg = lib.get_packages()[0]
+        self.assertTrue(pkg.is_equal(self.brd.get_libraries()[0].get_package(pkg.get_name())))
+        self.assertTrue(lib.is_equal(self.brd.get_libraries()[0]), "Clone should be equal")
+        old = lib.get_hash()
+
+        wire = [x for x in pkg.get_drawing_elements() if isinstance(x, Swoop.Wire)][0]
+        width = wire.get_width()
+        wire.set_width(width + 1)
+        self.assertNotEqual(lib.get_hash(), old, "Change not detected")
+        self.assertFalse(lib.is_equal(self.brd.get_libraries()[0]))
+        wire.set_width(float(width))
+        self.assertEqual(lib.get_hash(), old, "Hash should only depend on contents")
+
+        for p in Swoop.From(self.sch).get_libraries().get_packages():
+            b = self.brd.get_library(p.get_parent().get_name()).get_package(p.get_name())
+            if b is not None:
+                self.assertEqual(b.is_equal(p), b.get_xml() == p.get_xml())
+
+    def test_CloneTree(self):
+        for ef in [self.brd, self.sch, self.lbr]:
+            c = ef.clone()
+            self.assertIsNone(c.get_parent())
+            c.check_sanity()
+            self.assertEqual(c.get_xml(), ef.get_xml(), "Clone differs from original")
+            self.assertTrue(all(l.get_parent() is ef for l in ef.get_layersByName().values()), "Clone changed the original's layers")
+            self.assertTrue(all(l.get_parent() is c for l in c.get_layersByName().values()), "Clone's layers belong to the original")
+
+    def test_Snapshot(self):
+        before = self.brd.get_xml()
+        s = self.brd.snapshot()
+        path = os.path.join(self.tmpdir, "snapshot.brd")
+        s.write(path)
+        self.assertEqual(Swoop.EagleFile.from_file(path).get_xml(), before, "Snapshot writes different XML")
+
+        # Changes to the snapshot don't show up in the original...
+        s.get_element("C1").set_x(100.0)
+        self.assertEqual(self.brd.get_xml(), before, "Changing the snapshot changed the original")
+        self.assertEqual(s.get_element("C1").get_x(), 100.0)
+
+        # ... or the other way around.
+        s2 = self.brd.snapshot()
+        wire = self.brd.get_library("KoalaBuild").get_package("CAPC1608X90_HS").get_nth_drawing_element(0)
+        wire.set_width(7.0)
+        self.brd.get_element("C1").set_name("C1000")
+        self.assertEqual(s2.get_xml(), before, "Changing the original changed the snapshot")
+        self.assertIsNone(s2.get_element("C1000"))
+        s2.check_sanity()
+        self.assertTrue(all(l.get_parent() is s2 for l in s2.get_layersByName().values()), "Snapshot's layers belong to the original")
+
+        # Snapshots of snapshots, and queries on them.
+        s3 = s2.snapshot()
+        Swoop.From(s3).get_elements().set_locked(True)
+        self.assertEqual(s2.get_xml(), before, "Changing a snapshot changed its source")
+        self.assertTrue(all(Swoop.From(s3).get_elements().get_locked()))
+        s3.write(path)
+        self.assertEqual(Swoop.EagleFile.from_file(path).get_xml(), s3.get_xml(), "Snapshot writes different XML")
+
+    def test_Journal(self):
+        before = self.sch.get_xml()
+        copy = self.sch.clone()
+        j = self.sch.start_journal()
+        self.addCleanup(j.stop)
+        self.assertRaises(Swoop.SwoopError, self.sch.start_journal)
+
+        part = self.sch.get_nth_part(0)
+        part.set_value("10k")
+        part.set_name("NEW_NAME")
+        net = self.sch.get_nth_sheet(0).get_nth_net(0)
+        net.set_class("1")
+        net.get_nth_segment(0).clear_pinrefs()
+        self.sch.get_nth_sheet(0).add_net(Swoop.Net().set_name("JOURNAL_NET").add_segment(Swoop.Segment()))
+        self.sch.add_layer(self.sch.get_layers()[0].clone().set_number(250).set_name("JOURNAL_LAYER"))
+        after = self.sch.get_xml()
+        self.assertNotEqual(after, before)
+
+        middle = j.checkpoint()
+        part.set_value("20k")
+        j.rollback(middle)
+        self.assertEqual(self.sch.get_xml(), after, "Rollback to checkpoint failed")
+
+        j.rollback()
+        self.assertEqual(self.sch.get_xml(), before, "Rollback failed")
+        self.assertIs(self.sch.get_part(part.get_name()), part)
+        self.sch.check_sanity()
+
+        j.redo(middle)
+        self.assertEqual(self.sch.get_xml(), after, "Redo failed")
+
+        j.replay(copy)
+        self.assertEqual(copy.get_xml(), after, "Replay failed")
+        self.assertEqual(self.sch.get_xml(), after, "Replay changed the original")
+        copy.check_sanity()
+        j.stop()
+
+        # Transactions
+        try:
+            with self.sch.start_journal():
+                part.set_name("OTHER_NAME")
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.sch.get_xml(), after, "Transaction wasn't rolled back")
+
+    def test_BulkRemove(self):
+        brd = self.brd.clone()
+        plain = brd.get_plain_elements()
+        doomed = plain[::2]
+        kept = plain[1::2]
+        for e in doomed:
+            e.detach()
+        self.assertEqual(brd.get_plain_elements(), kept, "Removal changed the order")
+        self.assertTrue(all(e.get_parent() is None for e in doomed))
+        brd.check_sanity()
+
+        # Removing and re-adding in the same batch.
+        e = kept[0]
+        brd.remove_plain_element(e)
+        brd.remove_plain_element(kept[1])
+        brd.add_plain_element(e)
+        self.assertEqual(brd.get_plain_elements(), kept[2:] + [e])
+
+        # remove_child() finds the right collection.
+        signal = brd.get_signals()[0]
+        brd.remove_child(signal)
+        self.assertIsNone(brd.get_signal(signal.get_name()))
+        self.assertIsNone(signal.get_parent())
+
+        # Journaled removals, in any order, including some that were made
+        # before the journal started and some of parts that aren't there.
+        brd = self.brd.clone()
+        copy = brd.clone()
+        signal = max(brd.get_signals(), key=lambda s: len(s.get_wires()))
+        wires = signal.get_wires()
+        self.assertGreater(len(wires), 10)
+        signal.remove_wire(wires[3])
+        j = brd.start_journal()
+        self.addCleanup(j.stop)
+        before = signal.get_wires()
+        order = [9, 1, 7, 0, 3, 8, 2]
+        for n in order:
+            signal.remove_wire(wires[n])
+        signal.remove_wire(Swoop.Wire())
+        after = signal.get_wires()
+        self.assertEqual(after, [w for n, w in enumerate(wires) if n not in order])
+        self.assertEqual(j.checkpoint(), len(order) - 1)
+        j.rollback()
+        self.assertEqual(signal.get_wires(), before)
+        j.redo()
+        self.assertEqual(signal.get_wires(), after)
+        copy_signal = copy.get_signal(signal.get_name())
+        copy_signal.remove_wire(copy_signal.get_wires()[3])
+        j.replay(copy)
+        self.assertEqual(copy.get_xml(), brd.get_xml())
+
+    def test_FilePointer(self):
+        sch = self.sch.clone()
+        lib = sch.get_library("KoalaBuild")
+        pkg = lib.get_package("CAPC1608X90_HS")
+        self.assertIs(pkg.get_file(), sch)
+        self.assertIs(pkg.get_root(), sch)
+        self.assertIs(self.sch.get_library("KoalaBuild").get_package("CAPC1608X90_HS").get_file(), self.sch, "Clone shares file pointers")
+
+        lib.detach()
+        self.assertIsNone(pkg.get_file())
+        self.assertIs(pkg.get_root(), lib)
+
+        brd = self.brd.clone()
+        brd.remove_library(brd.get_library("KoalaBuild"))
+        brd.add_library(lib)
+        self.assertIs(pkg.get_file(), brd)
+        brd.check_sanity()
+        self.assertIs(brd.snapshot().get_library("KoalaBuild").get_package("CAPC1608X90_HS").get_file().get_filename(), brd.get_filename())
+
+    def test_LazyFrom(self):
+        visited = []
+        def visit(x):
+            visited.append(x)
+            return True
+        q = Swoop.From(self.sch).get_sheets().get_nets().filtered_by(visit).get_segments().get_pinrefs()
+        self.assertEqual(visited, [], "Query ran before it was used")
+        first = q.first()
+        self.assertIs(first, self.sch.get_sheets()[0].get_nets()[0].get_segments()[0].get_pinrefs()[0])
+        self.assertEqual(len(visited), 1, "first() didn't stop early")
+
+        eager = q.materialize()
+        self.assertEqual(q.count(), len(eager.unpack()))
+        self.assertEqual(q.with_part("U1").unpack(),
+                         [p for p in eager if p.get_part() == "U1"])
+        self.assertEqual(len(visited), 1 + len(Swoop.From(self.sch).get_sheets().get_nets()), "Materialized query ran again")
+
+    def test_FromAcrossMutation(self):
+        sch = self.sch.clone()
+        q = Swoop.From(sch).get_parts()
+        not_run = Swoop.From(sch).get_parts()
+        first = q.first()
+        n = len(q)
+        sch.add_part(Swoop.Part().set_name("NEW_PART"))
+
+        # q ran when len() needed it, and keeps its results.
+        self.assertEqual(q.count(), n)
+        self.assertEqual(len(list(q)), n)
+        self.assertEqual(len(q.unpack()), n)
+        self.assertIs(q.first(), first)
+        self.assertNotIn("NEW_PART", [p.get_name() for p in q])
+
+        # A query that hadn't run yet sees the new part, as does a new one.
+        self.assertEqual(len(list(not_run)), n + 1)
+        self.assertEqual(not_run.count(), n + 1)
+        self.assertEqual(Swoop.From(sch).get_parts().count(), n + 1)
+
+    def test_AttrIndex(self):
+        def pinrefs():
+            return Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_pinrefs()
+        def scan(part):
+            return [p for p in pinrefs() if p.get_part() == part]
+
+        # Without an index, the filter runs as the pinrefs are found, so first() stops early.
+        visited = []
+        def visit(x):
+            visited.append(x)
+            return True
+        first_part = pinrefs().first().get_part()
+        Swoop.From(self.sch).get_sheets().get_nets().filtered_by(visit).get_segments().get_pinrefs().with_part(first_part).first()
+        self.assertEqual(len(visited), 1)
+
+        self.assertRaises(Swoop.SwoopError, self.sch.create_index, Swoop.Pinref, "no_such_attr")
+        self.sch.create_index(Swoop.Pinref, "part")
+        self.assertTrue(self.sch.has_index(Swoop.Pinref, "part"))
+        self.assertIsNotNone(self.sch._find_index(("get_sheets", "get_nets", "get_segments", "get_pinrefs"), "part"))
+        # Instances have parts, too, but they aren't indexed.
+        self.assertIsNone(self.sch._find_index(("get_sheets", "get_instances"), "part"))
+
+        part = pinrefs().first().get_part()
+        expected = scan(part)
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(pinrefs().with_part(part).unpack(), expected)
+
+        # The index answers the query; the pinrefs aren't filtered one at a time.
+        cls = type(pinrefs().first())
+        calls = []
+        with_part = cls.with_part
+        def counting_with_part(self, *args):
+            calls.append(self)
+            return with_part(self, *args)
+        cls.with_part = counting_with_part
+        try:
+            self.assertEqual(pinrefs().with_part(part).unpack(), expected)
+        finally:
+            cls.with_part = with_part
+        self.assertEqual(calls, [])
+
+        self.assertEqual(Swoop.From(self.sch.get_sheets()[0]).get_nets().get_segments().get_pinrefs().with_part(part).count(),
+                         len([p for p in expected if p.get_parent().get_parent().get_parent() is self.sch.get_sheets()[0]]))
+        # Results come in the order a scan finds them, including repeats.
+        sheets = self.sch.get_sheets()[::-1] + self.sch.get_sheets()
+        self.assertEqual(Swoop.From(sheets).get_nets().get_segments().get_pinrefs().with_part(part).unpack(),
+                         [p for p in Swoop.From(sheets).get_nets().get_segments().get_pinrefs() if p.get_part() == part])
+
+        # Setters, adders, and removers keep it up to date.
+        p = expected[0]
+        p.set_part("RENAMED")
+        self.assertEqual(pinrefs().with_part("RENAMED").unpack(), [p])
+        self.assertEqual(pinrefs().with_part(part).unpack(), expected[1:])
+        p.set_part(part)
+        self.assertEqual(pinrefs().with_part(part).unpack(), expected, "Refiled part out of order")
+        p.set_part("RENAMED")
+        segment = p.get_parent()
+        net = segment.get_parent()
+        segment.detach()
+        self.assertEqual(pinrefs().with_part("RENAMED").count(), 0)
+        net.add_segment(segment.clone())
+        self.assertEqual(pinrefs().with_part("RENAMED").count(), 1)
+
+        j = self.sch.start_journal()
+        self.addCleanup(j.stop)
+        pinrefs().with_part("RENAMED").first().set_part("AGAIN")
+        j.rollback()
+        self.assertEqual(pinrefs().with_part("AGAIN").count(), 0)
+        self.assertEqual(pinrefs().with_part("RENAMED").count(), 1)
+
+        self.assertFalse(self.sch.clone().has_index(Swoop.Pinref, "part"))
+        self.sch.drop_index(Swoop.Pinref, "part")
+        self.assertFalse(self.sch.has_index(Swoop.Pinref, "part"))
+        self.assertEqual(pinrefs().with_part(part).unpack(), scan(part))
+
+    def test_Referrers(self):
+        element = self.brd.get_elements()[0]
+        package = element.find_package()
+        self.assertEqual(set(self.brd.get_referrers(package)),
+                         set(e for e in self.brd.get_elements() if e.find_package() is package) |
+                         set(d for d in Swoop.From(self.brd).get_libraries().get_devicesets().get_devices() if d.get_package() is not None and d.find_package() is package))
+        self.assertIn(element, self.brd.get_referrers(element.find_library()))
+
+        # Changes to the referring attribute are tracked.
+        other = [p for p in element.find_library().get_packages() if p is not package][0]
+        element.set_package(other.get_name())
+        self.assertNotIn(element, self.brd.get_referrers(package))
+        self.assertIn(element, self.brd.get_referrers(other))
+        element.detach()
+        self.assertNotIn(element, self.brd.get_referrers(other))
+
+        part = self.sch.get_parts()[0]
+        for target in [part.find_library(), part.find_deviceset(), part.find_device()]:
+            self.assertIn(part, self.sch.get_referrers(target))
+        gate = Swoop.From(part.find_deviceset()).get_gates().first()
+        self.assertIn(gate, self.sch.get_referrers(gate.find_symbol()))
+        self.assertEqual(set(self.sch.get_referrers(part.find_library())),
+                         set(p for p in self.sch.get_parts() if p.find_library() is part.find_library()))
+        self.assertEqual(set(self.sch.get_referrers(part)),
+                         set(Swoop.From(self.sch).get_sheets().get_instances().with_part(part.get_name())) |
+                         set(Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_pinrefs().with_part(part.get_name())))
+        self.assertEqual(self.sch.get_referrers(Swoop.Package()), [])
+
+    def test_FindLookups(self):
+        pinref = Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_pinrefs().first()
+        part = pinref.find_part()
+        self.assertIs(part, self.sch.get_part(pinref.get_part()))
+        gate = pinref.find_gate()
+        self.assertIs(gate, part.find_deviceset().get_gate(pinref.get_gate()))
+        self.assertIs(pinref.find_pin(), gate.find_symbol().get_pin(pinref.get_pin()))
+        instance = Swoop.From(self.sch).get_sheets().get_instances().with_part(part.get_name()).with_gate(gate.get_name()).first()
+        self.assertIs(instance.find_gate(), gate)
+        connect = Swoop.From(part.find_device()).get_connects().with_gate(gate.get_name()).with_pin(pinref.get_pin()).first()
+        self.assertIs(connect.find_gate(), gate)
+        self.assertIs(connect.find_pin(), pinref.find_pin())
+
+        # Renaming goes through the maps, so the lookups follow it.
+        Swoop.tools.rename_part(part.get_name(), "RENAMED", schematic=self.sch)
+        self.assertIs(pinref.find_part(), part)
+        self.assertIs(instance.find_gate(), gate)
+
+        contactref = Swoop.From(self.brd).get_signals().get_contactrefs().first()
+        element = contactref.find_element()
+        self.assertIs(element, self.brd.get_element(contactref.get_element()))
+        pad = contactref.find_pad()
+        self.assertIn(pad, element.find_package().get_pads() + element.find_package().get_smds())
+        self.assertEqual(pad.get_name(), contactref.get_pad())
+        self.assertIn(contactref, self.brd.get_referrers(pad))
+
+        signal = [s for s in self.brd.get_signals() if s.get_class() is not None][0]
+        netclass = signal.find_class()
+        self.assertEqual(netclass.get_number(), signal.get_class())
+        self.assertIn(signal, self.brd.get_referrers(netclass))
+
+    def test_DetachedLookups(self):
+        self.assertIsNone(Swoop.Pinref().set_part("X").find_part())
+        self.assertIsNone(Swoop.Pinref().set_part("X").set_gate("G").find_gate())
+        self.assertIsNone(Swoop.Pinref().set_part("X").set_gate("G").set_pin("P").find_pin())
+        self.assertIsNone(Swoop.Portref().set_moduleinst("X").find_moduleinst())
+        self.assertIsNone(Swoop.Portref().set_moduleinst("X").set_port("P").find_port())
+        self.assertIsNone(Swoop.Contactref().set_element("X").find_element())
+        self.assertIsNone(Swoop.Contactref().set_element("X").set_pad("P").find_pad())
+
+        sch = self.sch.clone()
+        pinref = Swoop.From(sch).get_sheets().get_nets().get_segments().get_pinrefs().first()
+        self.assertIsNotNone(pinref.find_part())
+        pinref.detach()
+        self.assertIsNone(pinref.find_part())
+        self.assertIsNone(pinref.find_pin())
+
+        # Moved somewhere the reference can't be resolved from.
+        segment = Swoop.Segment().add_pinref(pinref)
+        self.assertIsNone(pinref.find_part())
+
+        brd = self.brd.clone()
+        signal = [s for s in brd.get_signals() if s.get_class() is not None][0]
+        signal.detach()
+        self.assertIsNone(signal.find_class())
+
+    def test_Query(self):
+        def pinrefs():
+            return Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_pinrefs()
+
+        q = Swoop.Query("sheets/nets/segments/pinrefs[part=~'^U']")
+        self.assertEqual(q.run(self.sch).unpack(), [p for p in pinrefs() if p.get_part().startswith("U")])
+        self.assertIs(Swoop.compile_query(q.text), Swoop.compile_query(q.text))
+
+        net = Swoop.From(self.sch).get_sheets().get_nets().first()
+        part = pinrefs().first().get_part()
+        self.assertEqual(Swoop.From(self.sch).query("sheets/nets[name=$net]", net=net.get_name()).unpack(), [net])
+        q = Swoop.compile_query("sheets/nets[name=$net]/segments/pinrefs[part != $part]")
+        self.assertEqual(q.run(self.sch, net=net.get_name(), part=part).unpack(),
+                         [p for s in net.get_segments() for p in s.get_pinrefs() if p.get_part() != part])
+        self.assertRaises(Swoop.SwoopError, q.run, self.sch, net=net.get_name())
+
+        # The same answers with an index.
+        q = Swoop.compile_query("sheets/nets/segments/pinrefs[part=$part]")
+        expected = [p for p in pinrefs() if p.get_part() == part]
+        self.assertEqual(q.run(self.sch, part=part).unpack(), expected)
+        self.sch.create_index(Swoop.Pinref, "part")
+        self.assertEqual(q.run(self.sch, part=part).unpack(), expected)
+        self.assertEqual(Swoop.From(self.sch).query("sheets/nets[name=$net]/segments/pinrefs[part=$part]", net=net.get_name(), part=part).unpack(),
+                         [p for p in expected if p.get_parent().get_parent() is net])
+        # Steps that look up a range of keys visit the members in key order.
+        q = Swoop.compile_query("sheets/nets[name=~'^A']/segments/pinrefs[part='U1']")
+        expected = [p for s in self.sch.get_sheets() for n in sorted(s.get_nets(), key=lambda n: n.get_name()) if n.get_name().startswith("A")
+                    for g in n.get_segments() for p in g.get_pinrefs() if p.get_part() == "U1"]
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(q.run(self.sch).unpack(), expected)
+
+        self.assertEqual(Swoop.From(self.brd).query("libraries/packages[name=~'CAP']").count(),
+                         Swoop.From(self.brd).get_libraries().get_packages().with_name(Swoop.matching("CAP")).count())
+
+        for bad in ["sheets/netz", "sheets/nets[nme='GND']", "sheets/nets[name=GND]", "sheets//nets", "sheets/nets[name='GND'", "sheets/nets/", "sheets/nets[name=~'(']"]:
+            self.assertRaises(Swoop.SwoopError, Swoop.Query, bad)
+        self.assertRaises(Swoop.SwoopError, Swoop.Query, "sheets", Swoop.BoardFile)
+        self.assertRaises(Swoop.SwoopError, Swoop.Query("sheets/nets[name=~$re]").run, self.sch, re="(")
+
+    def test_RationalizeRefdes(self):
+        before = set(p.get_name() for p in self.sch.get_parts())
+        rename_map = Swoop.tools.rationalize_refdes(schematic=self.sch, board=self.brd)
+        self.assertEqual(set(rename_map.keys()), before)
+        names = set(p.get_name() for p in self.sch.get_parts())
+        self.assertTrue(names <= set(rename_map.values()))
+        self.assertTrue(all(p.get_part() in names for p in Swoop.From(self.sch).get_sheets().get_nets().get_segments().get_pinrefs()))
+        self.assertTrue(all(c.get_element() in names for c in Swoop.From(self.brd).get_signals().get_contactrefs()))
+        self.assertFalse(self.sch.has_index(Swoop.Pinref, "part"))
+        self.sch.check_sanity()
+
+    def test_RenamePartIgnoresCase(self):
+        for indexed in [False, True]:
+            sch = self.sch.clone()
+            if indexed:
+                sch.create_index(Swoop.Pinref, "part")
+            pinrefs = Swoop.From(sch).get_sheets().get_nets().get_segments().get_pinrefs()
+            name = [p.get_part() for p in pinrefs if p.get_part().lower() != p.get_part()][0]
+            refs = pinrefs.with_part(name).unpack()
+            refs[0].set_part(name.lower())
+            Swoop.tools.rename_part(name, "RENAMED", schematic=sch)
+            self.assertTrue(all(p.get_part() == "RENAMED" for p in refs))
+            self.assertEqual(pinrefs.with_part(name).count() + pinrefs.with_part(name.lower()).count(), 0)
+
+    def test_MapQueryPlan(self):
+        elements = self.brd.get_elements()
+        name = elements[0].get_name()
+        q = Swoop.From(self.brd).get_elements().with_name(name)
+        self.assertIsNone(q._call, "with_name() on a map wasn't planned as a lookup")
+        self.assertEqual(q.unpack(), [self.brd.get_element(name)])
+        self.assertEqual(Swoop.From(self.brd).get_elements().with_name("no such part").count(), 0)
+
+        prefix = name[:1]
+        q = Swoop.From(self.brd).get_elements().with_name(Swoop.matching("^" + prefix + ".*"))
+        self.assertEqual(set(q), set(e for e in elements if e.get_name().startswith(prefix)))
+        self.assertEqual(set(Swoop.From(self.brd).get_elements().with_name(Swoop.matching(prefix + "[0-9]"))),
+                         set(e for e in elements if re.match(prefix + "[0-9]", e.get_name())))
+
+        # The sorted keys have to keep up with the map.
+        keys = list(self.brd._get_sorted_keys("elements"))
+        self.brd.remove_element(elements[0])
+        self.assertEqual(self.brd._get_sorted_keys("elements"), [k for k in keys if k != name])
+        self.assertEqual(Swoop.From(self.brd).get_elements().with_name(name).count(), 0)
+
+        self.assertEqual(set(Swoop.From(self.brd).get_libraries().get_packages().with_name(Swoop.matching("^CAP"))),
+                         set(p for l in self.brd.get_libraries() for p in l.get_packages() if p.get_name().startswith("CAP")))
+
+        # Attributes that aren't the map's key still filter.
+        library = elements[1].get_library()
+        self.assertEqual(Swoop.From(self.brd).get_elements().with_library(library).unpack(),
+                         [e for e in self.brd.get_elements() if e.get_library() == library])